@@ -12,6 +12,7 @@ from sklearn.model_selection import StratifiedKFold, train_test_split
 from sklearn.preprocessing import LabelEncoder
 import numpy as np
 import statistics
+import functools
 import torch
 import torch.nn as nn
 
@@ -64,9 +65,10 @@ def train_and_test_physionet(physio_path, model, loss_fn):
         valid_ds = Subset(ds, valid_indices)
         test_ds = Subset(ds, test_indices)
 
-        train_loader = DataLoader(train_ds, batch_size=1, shuffle=True, collate_fn=physio_collate_image_mask)
-        valid_loader = DataLoader(valid_ds, batch_size=1, collate_fn=physio_collate_image_mask)
-        test_loader = DataLoader(test_ds, batch_size=1, collate_fn=physio_collate_image_mask)
+        collate_fn = functools.partial(physio_collate_image_mask, pin_memory=True)  # collated in the main process, so pin here
+        train_loader = DataLoader(train_ds, batch_size=1, shuffle=True, collate_fn=collate_fn)
+        valid_loader = DataLoader(valid_ds, batch_size=1, collate_fn=collate_fn)
+        test_loader = DataLoader(test_ds, batch_size=1, collate_fn=collate_fn)
 
         train_physionet(model, loss_fn, train_loader, valid_loader, checkpoint_name, cf, device)
         load_model(model, f'{checkpoint_name}-fold{cf}.pth')
@@ -93,7 +95,7 @@ def test_physionet(model, test_loader, weak_model=False, threshold=0.5, device="
     test_cfm = ConfusionMatrix()
     with torch.no_grad():
         for image, label in test_loader:
-            image, label = image.to(device), label.to(device)
+            image, label = image.to(device, non_blocking=True), label.to(device, non_blocking=True)
             if not label.any():
                 continue
             if weak_model:
@@ -1,7 +1,7 @@
 import argparse
 import json
-from utils.dataset import rsna_train_valid_split, RSNAICHDataset, rsna_collate_binary_label
-from utils.preprocessing import get_transform, Augmentation
+from utils.dataset import rsna_train_valid_split, RSNAICHDataset, rsna_collate_binary_label, memmap_worker_init_fn
+from utils.preprocessing import get_transform, Augmentation, GPUWindower
 from utils.utils import *
 from utils.train import train_one_epoch
 from torch.utils.data import DataLoader, WeightedRandomSampler
@@ -26,6 +26,8 @@ def main():
     do_augmentation = str_to_bool(config_dict["do_augmentation"])
     do_sampling = str_to_bool(config_dict["do_sampling"])
     validation_ratio = config_dict["validation_ratio"]
+    cache_name = config_dict["cache_name"]  # null to read the dicom files on every access
+    window_on_gpu = str_to_bool(config_dict["window_on_gpu"])
     data_path = config_dict["data_path"]
     extra_path = config_dict["extra_path"]
 
@@ -41,8 +43,10 @@ def main():
     if do_augmentation:
         augmentation = Augmentation()
 
-    train_ds = RSNAICHDataset(data_path, t_x, t_y, windows=windows, transform=transform)
-    validation_ds = RSNAICHDataset(data_path, v_x, v_y, windows=windows, transform=transform)
+    dataset_transform = None if window_on_gpu else transform  # GPUWindower resizes after windowing instead
+    train_ds = RSNAICHDataset(data_path, t_x, t_y, windows=windows, transform=dataset_transform, cache_name=f"{cache_name}_train" if cache_name else None, window_on_gpu=window_on_gpu)
+    validation_ds = RSNAICHDataset(data_path, v_x, v_y, windows=windows, transform=dataset_transform, cache_name=f"{cache_name}_valid" if cache_name else None, window_on_gpu=window_on_gpu)
+    windower = GPUWindower(windows, transform) if window_on_gpu else None
 
     train_sampler = None
     if do_sampling:
@@ -52,8 +56,8 @@ def main():
         class_weights = weights[target_list]
         train_sampler = WeightedRandomSampler(class_weights, len(class_weights), replacement=True)
 
-    train_loader = DataLoader(train_ds, batch_size=batch_size, num_workers=num_workers, shuffle=True, collate_fn=rsna_collate_binary_label, sampler=train_sampler)
-    valid_loader = DataLoader(validation_ds, batch_size=batch_size, num_workers=num_workers, collate_fn=rsna_collate_binary_label)
+    train_loader = DataLoader(train_ds, batch_size=batch_size, num_workers=num_workers, shuffle=True, collate_fn=rsna_collate_binary_label, sampler=train_sampler, pin_memory=True, worker_init_fn=memmap_worker_init_fn)
+    valid_loader = DataLoader(validation_ds, batch_size=batch_size, num_workers=num_workers, collate_fn=rsna_collate_binary_label, pin_memory=True, worker_init_fn=memmap_worker_init_fn)
 
     model = SwinWeak(in_ch, num_classes)
     checkpoint_name = model.__class__.__name__
@@ -67,7 +71,7 @@ def main():
     train_losses = []
     valid_losses = []
     while not early_stopping.early_stop and epochs <= epoch_number:
-        _metrics = train_one_epoch(model, opt, loss_fn, train_loader, valid_loader)
+        _metrics = train_one_epoch(model, opt, loss_fn, train_loader, valid_loader, windower=windower)
         val_loss = _metrics['valid_cfm'].get_mean_loss()
 
         train_losses.extend(_metrics['train_cfm'].losses)
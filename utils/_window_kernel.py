@@ -0,0 +1,25 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, _get_image_windows falls back to opencv
+    njit = None
+
+
+if njit is not None:
+    # eager float32 signature: numba does no value-based casting, so a stray python scalar would otherwise promote to float64
+    @njit('void(float32[::1], float32[::1], float32[::1], float32[:, ::1])', cache=True, fastmath=True)
+    def apply_windows(image, lowers, widths, out):
+        """
+           fused windowing kernel: image is a flat float32 HU array of N pixels, out is (K, N)
+           out[k, i] = clip((image[i] - lowers[k]) / widths[k], 0, 1) without temporaries, lowers[k] = centers[k] - widths[k] / 2
+           single-threaded on purpose: it runs inside DataLoader workers, which already parallelize over samples,
+           and numba's default threading layer is not fork-safe
+        """
+        zero, one = np.float32(0.0), np.float32(1.0)
+        for i in range(image.shape[0]):
+            v = image[i]
+            for k in range(lowers.shape[0]):
+                out[k, i] = min(one, max(zero, (v - lowers[k]) / widths[k]))
+else:
+    apply_windows = None
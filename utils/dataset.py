@@ -1,28 +1,68 @@
 import os
-from torch.utils.data import Dataset
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import Dataset, Subset
 import torch
 import pandas as pd
-from preprocessing import window_image
 from tqdm import tqdm
 from sklearn.model_selection import train_test_split
 import nibabel
-import pickle
 import numpy as np
 import csv
 import pydicom
-from torchvision.transforms.functional import rotate
+from pydicom.tag import Tag
+import cv2
+from _window_kernel import apply_windows
+
+# only the windowing tags and the tags pixel_array needs to decode the pixel data are parsed
+_DICOM_TAGS = [Tag(0x0028, 0x0002),  # samples per pixel
+               Tag(0x0028, 0x0004),  # photometric interpretation
+               Tag(0x0028, 0x0010),  # rows
+               Tag(0x0028, 0x0011),  # columns
+               Tag(0x0028, 0x0100),  # bits allocated
+               Tag(0x0028, 0x0101),  # bits stored
+               Tag(0x0028, 0x0102),  # high bit
+               Tag(0x0028, 0x0103),  # pixel representation
+               Tag(0x0028, 0x1050),  # window center
+               Tag(0x0028, 0x1051),  # window width
+               Tag(0x0028, 0x1052),  # intercept
+               Tag(0x0028, 0x1053),  # slope
+               Tag(0x7FE0, 0x0010)]  # pixel data
+_CACHE_IMAGE_SIZE = 512
 
 
 class RSNAICHDataset(Dataset):
-    def __init__(self, root_dir, filenames, labels, windows=None, transform=None):
+    def __init__(self, root_dir, filenames, labels, windows=None, transform=None, cache_name=None, window_on_gpu=False, override=False):
         """
         Specific pytorch dataset designed for RSNA ICH dataset
+        samples are contiguous tensors backed by numpy buffers; use pin_memory=True and num_workers > 0 in the DataLoader
+        if cache_name is given, the dicom files are decoded and windowed once into a memory-mapped uint8 .npy cache under root_dir;
+        cached samples are returned as uint8 and should be dequantized on the device (see preprocessing.dequantize)
+        the cache file is keyed on the filenames and windows, and override=True rebuilds it
+        if window_on_gpu is True, samples are the raw (1, 512, 512) stored pixels as int16 bits plus their (center, width, intercept, slope, signed)
+        tensor, to be windowed after the transfer by preprocessing.GPUWindower; the transform then belongs to the windower, since
+        resizing raw pixels would blend the int16 bits of unsigned values and reverse the window-then-resize order of the cpu paths
         """
+        assert not (window_on_gpu and cache_name is not None), 'the cache holds windowed images, it cannot be used with window_on_gpu'
+        assert not (window_on_gpu and transform is not None), 'with window_on_gpu, pass the transform to GPUWindower instead'
         self.train_dir = os.path.join(root_dir, 'stage_2_train')
         self.filenames = filenames
         self.labels = labels
+        self.labels_t = torch.from_numpy(np.asarray(labels, dtype=np.float32))  # indexed per sample instead of a new tensor each time
         self.transform = transform
         self.windows = windows
+        self.window_on_gpu = window_on_gpu
+
+        self.cache_path = _build_cache(root_dir, filenames, windows, cache_name, override) if cache_name is not None else None
+        self.images = None
+
+    def _open_memmap(self):
+        if self.cache_path is None or self.images is not None:
+            return
+        images = np.load(self.cache_path, mmap_mode='r')
+        assert images.shape == _cache_shape(self.filenames, self.windows), f'{self.cache_path} does not match the dataset, rebuild it with override=True'
+        self.images = images
 
     def __len__(self):
         return len(self.filenames)
@@ -31,17 +71,22 @@ class RSNAICHDataset(Dataset):
         if torch.is_tensor(item):
             item = item.tolist()
 
-        image_path = os.path.join(self.train_dir, self.filenames[item])
+        label = self.labels_t[item]
 
-        image, default_window_params = _read_image_2d(image_path)  # x, y
-        window_center, window_width, window_intercept, window_slope = default_window_params
-        label = torch.FloatTensor(self.labels[item])
+        if self.window_on_gpu:
+            image, window_params = _read_image_2d(os.path.join(self.train_dir, self.filenames[item]))
+            signed = image.dtype != np.uint16
+            # uint16 is reinterpreted rather than cast, so values above 32767 do not wrap; GPUWindower undoes it using signed
+            image = torch.from_numpy(image.view(np.int16) if not signed else image.astype(np.int16, copy=False))[None]
+            if image.shape[1:] != (_CACHE_IMAGE_SIZE, _CACHE_IMAGE_SIZE):  # a few scans are not 512x512; nearest keeps the stored bits exact
+                image = torch.nn.functional.interpolate(image[None].float(), size=(_CACHE_IMAGE_SIZE, _CACHE_IMAGE_SIZE), mode='nearest')[0].to(torch.int16)
+            return image, label, torch.tensor(window_params + [signed], dtype=torch.float32)
 
-        default_window = _get_image_windows(image, [(window_center, window_width)], window_intercept, window_slope)
-        if self.windows is not None:
-            image = torch.cat([default_window, _get_image_windows(image, self.windows, window_intercept, window_slope)])
+        if self.cache_path is not None:
+            self._open_memmap()  # no-op once opened, e.g. by memmap_worker_init_fn
+            image = torch.from_numpy(np.array(self.images[item]))  # already windowed, uint8
         else:
-            image = default_window
+            image = _read_and_window(os.path.join(self.train_dir, self.filenames[item]), self.windows)
 
         if self.transform is not None:
             image = self.transform(image)
@@ -50,25 +95,33 @@ class RSNAICHDataset(Dataset):
 
 
 class PhysioNetICHDataset(Dataset):
-    def __init__(self, root_dir, windows=None, transform=None):
+    def __init__(self, root_dir, windows=None, transform=None, override=False):
         """
         Specific pytorch dataset designed for PhysioNet ICH dataset
+        volumes are decoded once into memory-mapped .npy files under root_dir; the parent process only keeps filenames and offsets,
+        and each DataLoader worker maps the files read-only (memmap_worker_init_fn or on first access), sharing the page cache
+        slices and masks are returned as tensors over the contiguous arrays; with num_workers=0, pin in the collate fn
+        (functools.partial(physio_collate_image_mask, pin_memory=True)), with workers pass pin_memory=True and
+        worker_init_fn=memmap_worker_init_fn to the DataLoader instead
         """
         self.scans_dir = os.path.join(root_dir, 'ct_scans')
         self.masks_dir = os.path.join(root_dir, 'masks')
-        self.filenames = os.listdir(self.scans_dir)
+        self.filenames = sorted(os.listdir(self.scans_dir))
+        self.slices_path = os.path.join(root_dir, 'physionet_slices.npy')
+        self.masks_path = os.path.join(root_dir, 'physionet_masks.npy')
 
-        self.slices = []
+        self.slices = None  # (N, H, W) float16, opened lazily
         self.scans_num_slices = []
-        self.masks = []
+        self.offsets = None  # index of the first slice of each scan
+        self.masks = None  # (N, H, W) uint8, binary, opened lazily
         self.labels = []
         self.transform = transform
         self.windows = windows
 
         self.labels_path = os.path.join(root_dir, 'hemorrhage_diagnosis_raw_ct.csv')
-        self.read_dataset()
+        self.read_dataset(override)
 
-    def read_dataset(self):
+    def read_dataset(self, override=False):
         SUBTYPES = ["Epidural", "Intraparenchymal", "Intraventricular", "Subarachnoid", "Subdural", "No_Hemorrhage"]
         with open(self.labels_path, newline='') as labels_csv:
             reader = csv.DictReader(labels_csv)
@@ -80,41 +133,71 @@ class PhysioNetICHDataset(Dataset):
 
                 self.labels.append(label)
         self.labels = np.array(self.labels)
-
-        k = 0
-        pbar = tqdm(self.filenames, total=len(self.filenames))
-        pbar.set_description("reading physionet dataset")
-        for file in pbar:
-            scan = _read_image_3d(os.path.join(self.scans_dir, file), do_rotate=True)
-            mask = _read_image_3d(os.path.join(self.masks_dir, file), do_rotate=True)
-
-            num_slices = scan.shape[-1]
-            self.scans_num_slices.append(num_slices)
-
-            for i in range(num_slices):
-                self.slices.append(scan[:, :, i])
-                self.masks.append(mask[:, :, i])
-                k += 1
+        self.labels_t = torch.from_numpy(self.labels.astype(np.float32))
+
+        # headers only: total number of slices to allocate the contiguous (N, H, W) arrays once
+        shapes = [nibabel.load(os.path.join(self.scans_dir, file)).shape for file in self.filenames]
+        self.scans_num_slices = [shape[-1] for shape in shapes]
+        # all volumes share one (N, H, W) array, so a differently sized scan or mask is reported here rather than mid-copy
+        odd_scans = [file for file, shape in zip(self.filenames, shapes) if shape[:2] != shapes[0][:2]]
+        if odd_scans:
+            raise ValueError(f'scans with an in-plane size other than {shapes[0][:2]}: {odd_scans}')
+        odd_masks = [file for file, shape in zip(self.filenames, shapes) if nibabel.load(os.path.join(self.masks_dir, file)).shape != shape]
+        if odd_masks:
+            raise ValueError(f'masks whose shape differs from their scan: {odd_masks}')
+        self.offsets = np.cumsum([0] + self.scans_num_slices[:-1])
+        if not override and self._cache_matches():
+            return
+
+        height, width = shapes[0][1], shapes[0][0]  # swapped by the 90 degree rotation
+        shape = (sum(self.scans_num_slices), height, width)
+        slices = np.lib.format.open_memmap(self.slices_path + '.tmp', mode='w+', dtype=np.float16, shape=shape)
+        masks = np.lib.format.open_memmap(self.masks_path + '.tmp', mode='w+', dtype=np.uint8, shape=shape)
+
+        # nibabel releases the GIL while reading and decompressing, so volumes are decoded by a thread pool
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            pbar = tqdm(zip(executor.map(self._load_pair, self.filenames), self.offsets, self.scans_num_slices), total=len(self.filenames))
+            pbar.set_description("reading physionet dataset")
+            for (scan, mask), offset, num_slices in pbar:
+                slices[offset:offset + num_slices] = scan.transpose(2, 0, 1)
+                masks[offset:offset + num_slices] = (mask > 0).transpose(2, 0, 1)  # binary 0-1 masks
+
+        slices.flush(), masks.flush()
+        del slices, masks
+        os.replace(self.slices_path + '.tmp', self.slices_path), os.replace(self.masks_path + '.tmp', self.masks_path)
+
+    def _load_pair(self, file):
+        scan = _read_image_3d(os.path.join(self.scans_dir, file), do_rotate=True).numpy()
+        mask = _read_image_3d(os.path.join(self.masks_dir, file), do_rotate=True).numpy()
+        return scan, mask
+
+    def _cache_matches(self):
+        # files from another scan directory or from an older layout would misalign slices and labels
+        if not (os.path.isfile(self.slices_path) and os.path.isfile(self.masks_path)):
+            return False
+        num_slices = sum(self.scans_num_slices)
+        return np.load(self.slices_path, mmap_mode='r').shape[0] == num_slices and np.load(self.masks_path, mmap_mode='r').shape[0] == num_slices
+
+    def _open_memmap(self):
+        if self.slices is not None:
+            return
+        self.slices = np.load(self.slices_path, mmap_mode='r')
+        self.masks = np.load(self.masks_path, mmap_mode='r')
 
     def __len__(self):
-        return len(self.slices)
+        return sum(self.scans_num_slices)
 
     def __getitem__(self, item):
         if torch.is_tensor(item):
             item = item.tolist()
 
-        image = self.slices[item]
-        mask = self.masks[item]
-        label = self.labels[item]
-
-        if mask.max() > 0:  # change to range to 0-1
-            mask = (mask - mask.min()) / (mask.max() - mask.min())
+        self._open_memmap()  # no-op once opened, e.g. by memmap_worker_init_fn
+        image = torch.from_numpy(self.slices[item].astype(np.float32))
+        mask = torch.from_numpy(self.masks[item].astype(np.float32))
+        label = self.labels_t[item]
 
-        default_window = _get_image_windows(image, [(40, 120)], 0, 1)
-        if self.windows is not None:
-            image = torch.cat([default_window, _get_image_windows(image, self.windows, 0, 1)])
-        else:
-            image = default_window
+        all_windows = [(40, 120)] + list(self.windows or [])
+        image = _get_image_windows(image, all_windows, 0, 1)
 
         if self.transform is not None:
             image = self.transform(image)
@@ -123,93 +206,187 @@ class PhysioNetICHDataset(Dataset):
         return image, mask, label
 
 
-def physio_collate_image_mask(batch):
-    data = torch.stack([item[0] for item in batch])
-    mask = torch.stack([item[1] for item in batch])
+def physio_collate_image_mask(batch, pin_memory=False):
+    data = fast_stack([item[0] for item in batch], pin_memory)
+    mask = fast_stack([item[1] for item in batch], pin_memory)
 
     return [data, mask]
 
 
-def physio_collate_image_label(batch):
-    data = torch.stack([item[0] for item in batch])
-    target = torch.stack([item[2] for item in batch])
+def physio_collate_image_label(batch, pin_memory=False):
+    data = fast_stack([item[0] for item in batch], pin_memory)
+    target = fast_stack([item[2] for item in batch], pin_memory)
 
     return [data, target]
 
 
-def rsna_collate_binary_label(batch):
-    data = torch.stack([item[0] for item in batch])
-    target = torch.stack([item[1] for item in batch])
+def rsna_collate_binary_label(batch, pin_memory=False):
+    data = fast_stack([item[0] for item in batch], pin_memory)
+    target = fast_stack([item[1] for item in batch], pin_memory)
     target = target[:, -1:]
+    if len(batch[0]) == 3:  # raw pixels and window params for GPUWindower
+        return [data, target, fast_stack([item[2] for item in batch], pin_memory)]
     return [data, target]
 
 
-def rsna_collate_subtypes_label(batch):
-    data = torch.stack([item[0] for item in batch])
-    target = torch.stack([item[1] for item in batch])
+def rsna_collate_subtypes_label(batch, pin_memory=False):
+    data = fast_stack([item[0] for item in batch], pin_memory)
+    target = fast_stack([item[1] for item in batch], pin_memory)
     target = target[:, :-1]
+    if len(batch[0]) == 3:  # raw pixels and window params for GPUWindower
+        return [data, target, fast_stack([item[2] for item in batch], pin_memory)]
     return [data, target]
 
 
+def fast_stack(items, pin_memory=False):
+    """
+       copies the samples slot by slot into one preallocated batch tensor, page-locked if requested, so that .to(device, non_blocking=True) can be used
+       pinning here only pays off when collating in the main process (num_workers=0), e.g. functools.partial(rsna_collate_binary_label, pin_memory=True);
+       with worker processes, pass pin_memory=True to the DataLoader instead
+    """
+    out = torch.empty((len(items), *items[0].shape), dtype=items[0].dtype, pin_memory=pin_memory and torch.cuda.is_available())
+    for i, item in enumerate(items):
+        out[i].copy_(item)
+    return out
+
+
+def memmap_worker_init_fn(worker_id):
+    """
+       opens the memory-mapped cache inside each DataLoader worker, so that workers share the kernel page cache instead of
+       inheriting mapped pages from the parent process
+    """
+    dataset = torch.utils.data.get_worker_info().dataset
+    while isinstance(dataset, Subset):
+        dataset = dataset.dataset
+    dataset._open_memmap()
+
+
 def rsna_train_valid_split(root_dir: str, validation_size=0.05, random_state=42, override=False):
     """
        a method that splits the 2D dicom dataset into train and validation set based on the number of slices containing hemorrhage
        we save the split into files for faster computation and further requirements
     """
     SUBTYPES = ["epidural", "intraparenchymal", "intraventricular", "subarachnoid", "subdural", "any"]
-    train_file_split_path, validation_file_split_path = os.path.join(root_dir, 'train_file_split'), os.path.join(root_dir, 'validation_file_split')
-    train_label_split_path, validation_label_split_path = os.path.join(root_dir, 'train_label_split'), os.path.join(root_dir, 'validation_label_split')
-    if os.path.isfile(train_file_split_path) and os.path.isfile(validation_file_split_path) and os.path.isfile(train_label_split_path) and os.path.isfile(validation_label_split_path) and not override:
-        with open(train_file_split_path, "rb") as tf, open(train_label_split_path, "rb") as tl, open(validation_file_split_path, "rb") as vf, open(validation_label_split_path, "rb") as vl:
-            return pickle.load(tf), pickle.load(tl), pickle.load(vf), pickle.load(vl)
+    split_path = os.path.join(root_dir, 'train_valid_split.npz')
+    if os.path.isfile(split_path) and not override:
+        with np.load(split_path) as split:
+            return split['train_files'].tolist(), split['train_labels'], split['val_files'].tolist(), split['val_labels']
 
     labels_path = os.path.join(root_dir, 'stage_2_train.csv')
     train_path = os.path.join(root_dir, 'stage_2_train')
 
-    total_filenames = os.listdir(train_path)
-    corrupted_files = ['ID_6431af929.dcm']
-    for corrupted_file in corrupted_files:
-        if corrupted_file in total_filenames:
-            total_filenames.remove(corrupted_file)
+    # enumerating ~750k files is slow, so the sorted listing is kept next to the dataset
+    filenames_path = os.path.join(root_dir, 'filenames.npy')
+    if os.path.isfile(filenames_path) and not override:
+        total_filenames = np.load(filenames_path).tolist()
+    else:
+        with os.scandir(train_path) as entries:
+            total_filenames = sorted(entry.name for entry in entries)
+        np.save(filenames_path, np.array(total_filenames))
 
-    labels_dict = {}
-    with open(labels_path, newline='') as labels_csv:
-        reader = csv.reader(labels_csv, delimiter=",")
-        for i, row in enumerate(reader):
-            if i == 0:
-                continue
-            labels_dict[row[0]] = float(row[1])
+    corrupted_files = {'ID_6431af929.dcm'}
+    total_filenames = [filename for filename in total_filenames if filename not in corrupted_files]
 
-    labels = []
-    pbar = tqdm(total_filenames, total=len(total_filenames))
-    pbar.set_description("reading files and labels")
-    for filename in pbar:
-        labels.append([float(labels_dict[key]) for key in [filename.split('.')[0] + "_" + x for x in SUBTYPES]])
+    # one row per image id, one column per subtype
+    labels_df = pd.read_csv(labels_path, dtype={'ID': str, 'Label': np.float32}, engine='c')
+    labels_df[['ID', 'Subtype']] = labels_df['ID'].str.rsplit('_', n=1, expand=True)
+    labels_df = labels_df.drop_duplicates(subset=['ID', 'Subtype'])
+    label_matrix = labels_df.pivot(index='ID', columns='Subtype', values='Label').reindex(columns=SUBTYPES)
+    id_to_row = {image_id: i for i, image_id in enumerate(label_matrix.index)}
+    label_matrix = label_matrix.to_numpy(dtype=np.float32)
 
-    labels = np.array(labels)
+    labels = label_matrix[[id_to_row[filename.split('.')[0]] for filename in total_filenames]]
 
     train_filenames, validation_filenames, train_labels, validation_labels = train_test_split(total_filenames, labels, test_size=validation_size, random_state=random_state)
-    with open(train_file_split_path, "wb") as tf, open(train_label_split_path, "wb") as tl, open(validation_file_split_path, "wb") as vf, open(validation_label_split_path, "wb") as vl:
-        pickle.dump(train_filenames, tf), pickle.dump(train_labels, tl), pickle.dump(validation_filenames, vf), pickle.dump(validation_labels, vl)
+    np.savez(split_path, train_files=np.array(train_filenames), train_labels=train_labels, val_files=np.array(validation_filenames), val_labels=validation_labels)
 
     return train_filenames, train_labels, validation_filenames, validation_labels
 
 
-def _get_image_windows(image, windows: [(int, int)], intercept, slope):
-    window_images = []
-    for window in windows:
-        window_images.append(window_image(image, window, intercept, slope))
+def _build_cache(root_dir: str, filenames, windows, cache_name: str, override=False):
+    """
+       decodes and windows every dicom file once and writes the result quantized to uint8 (round(value * 255))
+       into a memory-mapped .npy of shape (N, K + 1, H, W), the default window first
+       the file name carries a hash of the filenames and windows, so a different split or set of windows never reuses it
+    """
+    key = hashlib.sha1(repr((list(filenames), [tuple(window) for window in windows or []])).encode()).hexdigest()[:12]
+    cache_path = os.path.join(root_dir, f'{cache_name}_{key}.npy')
+    shape = _cache_shape(filenames, windows)
+    if os.path.isfile(cache_path) and not override and np.load(cache_path, mmap_mode='r').shape == shape:
+        return cache_path
+
+    train_dir = os.path.join(root_dir, 'stage_2_train')
+    images = np.lib.format.open_memmap(cache_path + '.tmp', mode='w+', dtype=np.uint8, shape=shape)
+
+    pbar = tqdm(enumerate(filenames), total=len(filenames))
+    pbar.set_description(f"building {cache_name} cache")
+    for i, filename in pbar:
+        image = _read_and_window(os.path.join(train_dir, filename), windows)
+        if image.shape[1:] != shape[2:]:  # a few scans are not 512x512
+            image = torch.nn.functional.interpolate(image[None], size=shape[2:], mode='bilinear')[0]
+        images[i] = image.mul_(255).round_().numpy().astype(np.uint8)
 
-    return torch.stack(window_images)
+    images.flush()
+    del images
+    os.replace(cache_path + '.tmp', cache_path)
+    return cache_path
+
+
+def _cache_shape(filenames, windows):
+    return len(filenames), 1 + len(windows or []), _CACHE_IMAGE_SIZE, _CACHE_IMAGE_SIZE
+
+
+def _get_image_windows(image, windows: [(int, int)], intercept, slope):
+    # (1, H, W) float image -> (K, H, W) windows in range 0-1
+    # the fused numba kernel does all windows in one pass when numba is installed; otherwise opencv writes each window in place
+    # with three SIMD calls that release the GIL, where a torch broadcast would allocate several (K, H, W) temporaries
+    if apply_windows is not None:
+        centers = np.array([center for center, _ in windows], dtype=np.float32)
+        widths = np.array([width for _, width in windows], dtype=np.float32)
+        hu = (image.numpy() * slope + intercept).astype(np.float32, copy=False).ravel()
+        out = np.empty((len(windows), hu.size), dtype=np.float32)
+        apply_windows(hu, centers - widths * np.float32(0.5), widths, out)  # lowers computed in float32
+        return torch.from_numpy(out.reshape(len(windows), *image.shape))
+
+    image = image.numpy()
+    out = np.empty((len(windows), *image.shape), dtype=np.float32)
+    for k, (center, width) in enumerate(windows):
+        # HU conversion and window scaling fused into one call, then clamped to 0-1 by two truncating thresholds
+        # (convertScaleAbs would mirror values below the window instead of clipping them)
+        cv2.addWeighted(image, slope / width, image, 0, (intercept - (center - width / 2)) / width, dst=out[k])
+        cv2.threshold(out[k], 1, 1, cv2.THRESH_TRUNC, dst=out[k])
+        cv2.threshold(out[k], 0, 0, cv2.THRESH_TOZERO, dst=out[k])
+    return torch.from_numpy(out)
+
+
+@functools.lru_cache(maxsize=256)
+def _window_lut(center, width, intercept, slope, signed):
+    # windowed value of every possible 16-bit stored pixel value
+    stored = np.arange(65536, dtype=np.uint16)
+    if signed:
+        stored = stored.view(np.int16)
+    hu = stored.astype(np.float32) * slope + intercept
+    return np.clip((hu - (center - width / 2)) / width, 0, 1).astype(np.float32)
+
+
+def _windows_via_lut(image, windows: [(int, int)], intercept, slope):
+    # dicom pixels are 12-16 bit integers, so each window is a single gather from a precomputed lookup table
+    signed = image.dtype == np.int16
+    image_u16 = image.view(np.uint16) if signed else image.astype(np.uint16, copy=False)
+
+    out = np.empty((len(windows), *image.shape), dtype=np.float32)
+    for k, (center, width) in enumerate(windows):
+        np.take(_window_lut(center, width, intercept, slope, signed), image_u16, out=out[k], mode='clip')  # indices always in range, clip avoids buffering out
+    return torch.from_numpy(out)
 
 
 def _read_image_3d(file_path: str, do_rotate=False):
     assert file_path is not None, 'file path is needed'
     assert os.path.isfile(file_path), 'wrong file path'
 
-    image = torch.FloatTensor(nibabel.load(filename=file_path).get_fdata())
-    if do_rotate:
-        image = rotate(image.permute(2, 0, 1), 90).permute(1, 2, 0)
+    image = torch.from_numpy(nibabel.load(filename=file_path).get_fdata(caching='unchanged', dtype=np.float32))
+    if do_rotate:  # 90 degrees counter-clockwise in the x-y plane, an exact 90° copy, no interpolation
+        image = torch.rot90(image, k=1, dims=(0, 1))
     return image
 
 
@@ -235,7 +412,14 @@ def _read_image_2d(file_path: str):
     assert file_path is not None, 'file path is needed'
     assert os.path.isfile(file_path), 'wrong file path'
 
-    image = pydicom.read_file(file_path)
+    image = pydicom.dcmread(file_path, specific_tags=_DICOM_TAGS)  # _get_windowing handles multi-valued tags as before
     window_params = _get_windowing(image)
-    image = torch.FloatTensor(image.pixel_array.astype(np.float32))
-    return image, window_params
+    return image.pixel_array, window_params
+
+
+def _read_and_window(file_path: str, windows: [(int, int)] = None):
+    # reads the stored pixels and windows them straight through the lookup tables into one (K + 1, H, W) float32 tensor,
+    # the default window of the file first, without intermediate float copies of the image
+    pixels, (window_center, window_width, window_intercept, window_slope) = _read_image_2d(file_path)
+    all_windows = [(window_center, window_width)] + list(windows or [])
+    return _windows_via_lut(pixels, all_windows, window_intercept, window_slope)
@@ -1,22 +1,42 @@
 from torchvision import transforms
 import torch
+import torch.nn as nn
 import numpy as np
 import random
 
 
-def window_image(image, window_params, intercept, slope, rescale=True):
-    center, width = window_params
-    img_min = center - width // 2
-    img_max = center + width // 2
-
-    image = image * slope + intercept
-    image[image < img_min] = img_min
-    image[image > img_max] = img_max
-
-    if rescale and (image.max() - image.min()) > 0:
-        image = (image - image.min()) / (image.max() - image.min())
-
-    return torch.FloatTensor(image)
+class GPUWindower(nn.Module):
+    def __init__(self, windows=None, transform=None):
+        """
+        windows raw dicom pixels on the device: the per-sample default window first, then the fixed windows
+        input is (B, 1, H, W) stored pixel values as int16 bits and (B, 5) window params (center, width, intercept, slope, signed),
+        output is (B, K + 1, H, W), passed through transform (e.g. get_transform) after windowing, as the cpu paths do
+        """
+        super().__init__()
+        self.transform = transform
+        windows = list(windows or [])
+        self.register_buffer('centers', torch.tensor([center for center, _ in windows], dtype=torch.float32).view(1, -1, 1, 1))
+        self.register_buffer('widths', torch.tensor([width for _, width in windows], dtype=torch.float32).view(1, -1, 1, 1))
+
+    def forward(self, x, window_params):
+        center, width, intercept, slope, signed = (window_params[:, i].view(-1, 1, 1, 1) for i in range(5))
+        x = x.float()
+        x = torch.where((signed == 0) & (x < 0), x + 65536, x)  # unsigned stored values sent as int16 bits
+        hu = x.mul_(slope).add_(intercept)
+
+        centers = torch.cat([center, self.centers.expand(x.shape[0], -1, -1, -1)], dim=1)
+        widths = torch.cat([width, self.widths.expand(x.shape[0], -1, -1, -1)], dim=1)
+        out = ((hu - (centers - widths / 2)) / widths).clamp_(0, 1)
+        if self.transform is not None:
+            out = self.transform(out)
+        return out
+
+
+def dequantize(image):
+    # uint8 windowed images (0-255) back to float in range 0-1, meant to run on the device after the transfer
+    if image.dtype == torch.uint8:
+        return image.float().mul_(1 / 255)
+    return image
 
 
 def get_transform(image_size):
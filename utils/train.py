@@ -1,20 +1,27 @@
 import torch.optim
 from utils import *
 from tqdm import tqdm
-from preprocessing import Augmentation
+from preprocessing import Augmentation, dequantize
 
 
-def train_one_epoch(model: torch.nn.Module, optimizer: torch.optim.Optimizer, loss_fn, train_loader, valid_loader, device='cuda'):
+def train_one_epoch(model: torch.nn.Module, optimizer: torch.optim.Optimizer, loss_fn, train_loader, valid_loader, device='cuda', windower=None):
+    # windower: optional preprocessing.GPUWindower for loaders that yield raw pixels and window params
     model.to(device)
+    if windower is not None:
+        windower.to(device)
     model.train()
     pbar_train = tqdm(enumerate(train_loader), total=len(train_loader), leave=False)
     pbar_train.set_description('training')
     _metrics = {"train_cfm": ConfusionMatrix(), "valid_cfm": ConfusionMatrix()}
     augmentation = Augmentation(device)
 
-    for i, (sample, label) in pbar_train:
+    for i, (sample, label, *window_params) in pbar_train:
         optimizer.zero_grad()
-        sample, label = augmentation(sample.to(device)), label.to(device)
+        _check_windower(windower, window_params)
+        sample, label = sample.to(device, non_blocking=True), label.to(device, non_blocking=True)
+        if windower is not None:
+            sample = windower(sample, window_params[0].to(device, non_blocking=True))
+        sample = augmentation(dequantize(sample))
 
         pred = model(sample)
         loss = loss_fn(pred, label)
@@ -31,8 +38,12 @@ def train_one_epoch(model: torch.nn.Module, optimizer: torch.optim.Optimizer, lo
     pbar_valid.set_description('validating')
 
     with torch.no_grad():
-        for i, (sample, label) in pbar_valid:
-            sample, label = sample.to(device), label.to(device)
+        for i, (sample, label, *window_params) in pbar_valid:
+            _check_windower(windower, window_params)
+            sample, label = sample.to(device, non_blocking=True), label.to(device, non_blocking=True)
+            if windower is not None:
+                sample = windower(sample, window_params[0].to(device, non_blocking=True))
+            sample = dequantize(sample)
 
             pred = model(sample)
             loss = loss_fn(pred, label)
@@ -45,6 +56,13 @@ def train_one_epoch(model: torch.nn.Module, optimizer: torch.optim.Optimizer, lo
     return _metrics
 
 
+def _check_windower(windower, window_params):
+    if window_params and windower is None:
+        raise ValueError('the loader yields raw pixels and window params (window_on_gpu), pass a GPUWindower as windower')
+    if windower is not None and not window_params:
+        raise ValueError('a windower was given but the loader yields already windowed images')
+
+
 def train_one_epoch_segmentation(model: torch.nn.Module, optimizer: torch.optim.Optimizer, loss_fn, train_loader, valid_loader, device='cuda', augmentation=None):
     model.to(device)
     model.train()
@@ -56,7 +74,7 @@ def train_one_epoch_segmentation(model: torch.nn.Module, optimizer: torch.optim.
         if not label.any():
             continue
         optimizer.zero_grad()
-        sample, label = sample.to(device), label.to(device)
+        sample, label = sample.to(device, non_blocking=True), label.to(device, non_blocking=True)
         if augmentation:
             sample, label = augmentation(sample, label)
 
@@ -81,7 +99,7 @@ def train_one_epoch_segmentation(model: torch.nn.Module, optimizer: torch.optim.
         for i, (sample, label) in pbar_valid:
             if not label.any():
                 continue
-            sample, label = sample.to(device), label.to(device)
+            sample, label = sample.to(device, non_blocking=True), label.to(device, non_blocking=True)
 
             pred = model(sample)
             loss = loss_fn(pred.squeeze(1), label)